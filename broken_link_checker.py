@@ -1,85 +1,351 @@
 import argparse
-import requests
+import asyncio
+import aiohttp
+import functools
+import io
+import lxml.html
+import orjson
+import re
+import socket
 import sys
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-import concurrent.futures
-import json
+import yarl
+from lxml import etree
+from urllib.parse import urljoin, urlparse, urlunparse
 import csv
 
+try:
+    import uvloop  # faster event loop; not available on Windows
+except ImportError:
+    uvloop = None
+
 # === Global defaults ===
 TIMEOUT = 10         # default request timeout
-MAX_WORKERS = 10     # default thread pool size
+MAX_WORKERS = 50     # default concurrency level
+PER_HOST_LIMIT = 4   # max in-flight requests to any single host
+KEEPALIVE = 30       # seconds an idle pooled connection is kept open
+DNS_CACHE_TTL = 300  # seconds a resolved hostname is reused
+MAX_PAGE_BYTES = 5_000_000  # pages are truncated past this size
+OUTPUT_BATCH = 64    # result lines buffered before each stdout write
+USER_AGENT = "broken-link-checker/1.0"
+HEAD_REJECTED = {403, 405, 501}  # statuses that mean "HEAD not supported"
+
+# Absolute http(s) URLs need no joining; anything else with a scheme
+# (javascript:, mailto:, tel:, ...) or a bare fragment is never checked.
+_HTTP_URL = re.compile(r"^https?://", re.I)
+_SKIP_HREF = re.compile(r"^(?:#|[a-z][a-z0-9+.\-]*:)", re.I)
+
+# Hosts that answered HEAD with one of HEAD_REJECTED; checked with GET directly.
+# Only touched from the event loop thread, so no lock is needed.
+HEAD_BAD = set()
+
+# (hostname, port) pairs that refused or failed to resolve earlier in the run;
+# further links to them are reported broken without another connection attempt.
+DEAD_HOSTS = set()
+
+# One semaphore per host, so a slow host only ties up its own slots and the
+# wait for a slot does not count against the request timeout.
+HOST_SLOTS = {}
 
-def fetch_page(url):
+def host_slot(host):
+    slot = HOST_SLOTS.get(host)
+    if slot is None:
+        slot = HOST_SLOTS[host] = asyncio.Semaphore(PER_HOST_LIMIT)
+    return slot
+
+def url_origin(url):
+    # (host, port) of a URL, or None when the URL has no usable host. The host
+    # is yarl's IDNA-encoded raw_host, the same key the connector passes to
+    # the resolver and reports in ClientConnectorError.
     try:
-        response = requests.get(url, timeout=TIMEOUT)
-        if response.status_code == 200:
-            return response.text
-        else:
-            print(f"Warning: {url} returned {response.status_code}")
-            return None
-    except Exception as e:
-        print(f"Error fetching {url}: {e}")
+        parsed = yarl.URL(url)
+        host, port = parsed.raw_host, parsed.port
+    except ValueError:
         return None
+    if host is None:
+        return None
+    return (host, port)
 
-def extract_links(base_url, html):
-    soup = BeautifulSoup(html, "html.parser")
-    links = set()
-    for tag in soup.find_all("a", href=True):
-        href = tag.get("href")
-        full_url = urljoin(base_url, href)
-        parsed = urlparse(full_url)
-        if parsed.scheme in ["http", "https"]:
-            links.add(full_url)
-    return list(links)
-
-def check_link(url):
+class CachingResolver(aiohttp.abc.AbstractResolver):
+    # Threaded resolver that keeps each successful lookup for DNS_CACHE_TTL,
+    # so hosts resolved ahead of time by prewarm_dns are reused when the
+    # connector opens its first connection to them.
+    def __init__(self, resolver=None):
+        self._resolver = resolver or aiohttp.ThreadedResolver()
+        self._cache = {}
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        loop = asyncio.get_running_loop()
+        key = (host, port, family)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < loop.time():
+            # Store the future itself so concurrent lookups of one host share it
+            lookup = asyncio.ensure_future(self._resolver.resolve(host, port, family))
+            lookup.add_done_callback(functools.partial(self._forget_failure, key))
+            entry = self._cache[key] = (loop.time() + DNS_CACHE_TTL, lookup)
+        # Shielded so a caller that times out does not cancel the shared lookup
+        return await asyncio.shield(entry[1])
+
+    def _forget_failure(self, key, lookup):
+        # Failures (often transient: SERVFAIL, resolver timeouts) are not
+        # cached, so the next request to the host tries DNS again
+        if lookup.cancelled() or lookup.exception() is not None:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] is lookup:
+                del self._cache[key]
+
+    async def close(self):
+        self._cache.clear()
+        await self._resolver.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+async def prewarm_dns(resolver, links):
+    # Resolve every distinct host concurrently before any link is checked, so
+    # the first request to each host does not wait on DNS inside its timeout
+    origins = {origin for origin in map(url_origin, links) if origin is not None}
+    # AF_UNSPEC matches the family the connector asks the resolver for
+    lookups = asyncio.gather(*(resolver.resolve(host, port, socket.AF_UNSPEC)
+                               for host, port in origins), return_exceptions=True)
+    try:
+        await asyncio.wait_for(lookups, TIMEOUT)
+    except asyncio.TimeoutError:
+        pass  # slow lookups keep running and are picked up by the checks
+
+def create_session(resolver=None):
+    # One pooled session is shared by page fetches and link checks, so
+    # connections (and their TCP/TLS handshakes) are reused per host and
+    # each hostname is resolved at most once per DNS_CACHE_TTL.
+    connector = aiohttp.TCPConnector(limit=MAX_WORKERS * 20, limit_per_host=PER_HOST_LIMIT,
+                                     keepalive_timeout=KEEPALIVE, resolver=resolver,
+                                     use_dns_cache=True, ttl_dns_cache=DNS_CACHE_TTL)
+    return aiohttp.ClientSession(connector=connector,
+                                 headers={"User-Agent": USER_AGENT},
+                                 timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+
+async def fetch_page(session, url):
     try:
-        response = requests.head(url, timeout=TIMEOUT, allow_redirects=True)
-        if response.status_code >= 400:
-            return (url, False, response.status_code)
-        return (url, True, response.status_code)
+        async with host_slot(urlparse(url).netloc), session.get(url) as response:
+            if response.status == 200:
+                # Stream the body so huge pages are cut off at MAX_PAGE_BYTES.
+                # The raw bytes go to the parser along with the Content-Type
+                # charset; without one, lxml falls back to sniffing <meta>.
+                body = bytearray()
+                async for chunk in response.content.iter_chunked(65536):
+                    body += chunk
+                    if len(body) >= MAX_PAGE_BYTES:
+                        print(f"Warning: {url} exceeds {MAX_PAGE_BYTES} bytes, truncating")
+                        del body[MAX_PAGE_BYTES:]
+                        break
+                return (bytes(body), response.charset)
+            else:
+                print(f"Warning: {url} returned {response.status}")
+                return None
     except Exception as e:
-        return (url, False, str(e))
+        print(f"Error fetching {url}: {str(e) or type(e).__name__}")
+        return None
+
+@functools.lru_cache(maxsize=65536)
+def canonicalize(url):
+    # Lowercase scheme and host, default an empty path to "/" and drop the
+    # fragment, so equivalent spellings of a URL are only checked once.
+    p = urlparse(url)
+    return urlunparse((p.scheme.lower(), p.netloc.lower(), p.path or "/", p.params, p.query, ""))
 
-def crawl(base_url, depth, same_domain_only=True):
+def extract_links(base_url, html, charset=None):
+    parser = None
+    if charset:
+        try:
+            parser = lxml.html.HTMLParser(encoding=charset)
+        except LookupError:
+            pass  # unknown charset name in the header; let lxml sniff instead
+    try:
+        doc = lxml.html.fromstring(html, parser=parser)
+    except etree.ParserError:
+        return set()  # empty or whitespace-only document
+    # Relative links resolve against <base href> when the page declares one
+    base_href = doc.xpath("//base/@href")
+    if base_href:
+        try:
+            base_url = urljoin(base_url, base_href[0].strip())
+        except ValueError:
+            pass  # malformed <base href>; keep resolving against the page URL
+    links = set()
+    # Pages repeat the same hrefs heavily (menus, pagination); dedupe the raw
+    # strings first so each distinct href goes through the filter only once
+    for href in set(doc.xpath("//a/@href")):
+        href = href.strip()
+        try:
+            if _HTTP_URL.match(href):
+                links.add(canonicalize(href))
+            elif href and not _SKIP_HREF.match(href):
+                links.add(canonicalize(urljoin(base_url, href)))
+        except ValueError:
+            continue  # malformed URL, e.g. an unterminated IPv6 host
+    return links
+
+async def check_link(session, url):
+    host = urlparse(url).netloc
+    origin = url_origin(url)
+    if origin is None:
+        return (url, False, "invalid-host")
+    async with host_slot(host):
+        # Checked after acquiring the slot so links queued behind the first
+        # failure to a host skip the connection attempt
+        if origin in DEAD_HOSTS:
+            return (url, False, "cached-dead-host")
+        try:
+            status = None
+            if host not in HEAD_BAD:
+                try:
+                    async with session.head(url, allow_redirects=True) as response:
+                        status = response.status
+                except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as e:
+                    if isinstance(e, aiohttp.ClientConnectorError):
+                        raise  # could not connect at all; handled as a dead host below
+                    # Some servers drop the connection on HEAD; treat it like a 405
+                    HEAD_BAD.add(host)
+                else:
+                    if status in HEAD_REJECTED:
+                        HEAD_BAD.add(host)
+            if status is None or status >= 400:
+                # Some servers reject HEAD outright; confirm with a GET before reporting
+                async with session.get(url, allow_redirects=True) as response:
+                    status = response.status
+            if status >= 400:
+                return (url, False, status)
+            return (url, True, status)
+        except aiohttp.ClientConnectorError as e:
+            # Ignore failures on a redirect target; only the link's own host is cached
+            if (e.host, e.port) == origin:
+                DEAD_HOSTS.add(origin)
+            return (url, False, str(e))
+        except Exception as e:
+            # asyncio timeouts carry no message, so fall back to the exception name
+            return (url, False, str(e) or type(e).__name__)
+
+async def crawl(session, base_url, depth, same_domain_only=True):
+    base_url = canonicalize(base_url)
+    base_domain = urlparse(base_url).netloc
     visited = set()
-    to_visit = [(base_url, 0)]
     all_links = set()
-    base_domain = urlparse(base_url).netloc
+    frontier = {base_url}
+    check_domain = base_domain if same_domain_only else None
+    netloc_cache = {}
 
-    while to_visit:
-        current_url, current_depth = to_visit.pop()
-        if current_url in visited or current_depth > depth:
-            continue
-        visited.add(current_url)
+    async def fetch(url):
+        return url, await fetch_page(session, url)
 
-        html = fetch_page(current_url)
-        if not html:
-            continue
+    # Breadth-first, one level at a time: every page of a level is fetched
+    # concurrently, and URLs are deduplicated when queued rather than when popped.
+    # Pages are parsed as they arrive, while the rest of the level is in flight.
+    for current_depth in range(depth + 1):
+        if not frontier:
+            break
+        visited |= frontier
+        fetches = [fetch(url) for url in frontier]
 
-        links = extract_links(current_url, html)
-        for link in links:
-            if same_domain_only and urlparse(link).netloc != base_domain:
+        next_frontier = set()
+        for fut in asyncio.as_completed(fetches):
+            current_url, page = await fut
+            if not page:
                 continue
-            all_links.add(link)
-            if current_depth < depth:
-                to_visit.append((link, current_depth + 1))
+            html, charset = page
+            links = extract_links(current_url, html, charset)
+            for link in links:
+                if check_domain is not None:
+                    # Pages of one site share most links, so parse each URL once
+                    nl = netloc_cache.get(link)
+                    if nl is None:
+                        nl = netloc_cache[link] = urlparse(link).netloc
+                    if nl != check_domain:
+                        continue
+                all_links.add(link)
+                if current_depth < depth and link not in visited:
+                    next_frontier.add(link)
+        frontier = next_frontier
 
-    return list(all_links)
+    return all_links
 
 def output_broken(broken, fmt):
     filename = f"broken_links.{fmt}"
-    with open(filename, "w", newline="", encoding="utf-8") as f:
-        if fmt == "json":
-            json.dump(broken, f, indent=2)
-        elif fmt == "csv":
-            writer = csv.writer(f)
-            writer.writerow(["URL", "Error"])
-            writer.writerows(broken)
+    if fmt == "json":
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(broken, option=orjson.OPT_INDENT_2))
+    elif fmt == "csv":
+        # Build the whole report in memory and hand it to the file in one write
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["URL", "Error"])
+        writer.writerows(broken)
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            f.write(buf.getvalue())
     print(f"Saved report to {filename}")
 
+async def run(args):
+    base = args.url
+    if not base.startswith(("http://", "https://")):
+        base = "http://" + base
+
+    async with CachingResolver() as resolver, create_session(resolver) as session:
+        print(f"Scanning {base} ... (depth={args.depth}, same-domain={args.same_domain})")
+        if args.depth > 0:
+            links = await crawl(session, base, args.depth, same_domain_only=args.same_domain)
+        else:
+            page = await fetch_page(session, base)
+            if not page:
+                print("Cannot proceed without fetching the base page.", file=sys.stderr)
+                return 1
+            html, charset = page
+            links = extract_links(base, html, charset)
+            if args.same_domain:
+                base_domain = urlparse(base).netloc.lower()
+                links = [l for l in links if urlparse(l).netloc == base_domain]
+
+        if not links:
+            print("No links found.")
+            return 0
+
+        print(f"Found {len(links)} unique links. Checking...")
+        await prewarm_dns(resolver, links)
+
+        # Schedule same-host links back to back so they reuse pooled connections
+        links = sorted(links, key=lambda u: urlparse(u).netloc)
+
+        broken = []
+        out = []
+        # Start the tasks here, in sorted order: as_completed() schedules bare
+        # coroutines from a set, which would scatter the host grouping
+        tasks = [asyncio.ensure_future(check_link(session, url)) for url in links]
+        for fut in asyncio.as_completed(tasks):
+            url, ok, status = await fut
+            if not ok:
+                broken.append((url, status))
+                out.append(f"[BROKEN] {url} -> {status}\n")
+            else:
+                out.append(f"[OK]     {url} -> {status}\n")
+            if len(out) >= OUTPUT_BATCH:
+                sys.stdout.write("".join(out))
+                out.clear()
+        sys.stdout.write("".join(out))
+
+    print("\nSummary:")
+    print(f"Total links checked: {len(links)}")
+    print(f"Broken links: {len(broken)}")
+    if broken:
+        print("\nList of broken links:")
+        for url, reason in broken:
+            print(f" - {url} ({reason})")
+        if args.output:
+            output_broken(broken, args.output)
+        return 2
+    else:
+        print("All links are healthy.")
+        return 0
+
 def main():
     global TIMEOUT, MAX_WORKERS
 
@@ -100,53 +366,8 @@ def main():
     TIMEOUT = args.timeout
     MAX_WORKERS = args.workers
 
-    base = args.url
-    if not base.startswith(("http://", "https://")):
-        base = "http://" + base
-
-    print(f"Scanning {base} ... (depth={args.depth}, same-domain={args.same_domain})")
-    if args.depth > 0:
-        links = crawl(base, args.depth, same_domain_only=args.same_domain)
-    else:
-        html = fetch_page(base)
-        if not html:
-            print("Cannot proceed without fetching the base page.", file=sys.stderr)
-            sys.exit(1)
-        links = extract_links(base, html)
-        if args.same_domain:
-            base_parsed = urlparse(base)
-            links = [l for l in links if urlparse(l).netloc == base_parsed.netloc]
-
-    if not links:
-        print("No links found.")
-        return
-
-    print(f"Found {len(links)} unique links. Checking...")
-
-    broken = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        future_to_url = {executor.submit(check_link, url): url for url in links}
-        for fut in concurrent.futures.as_completed(future_to_url):
-            url, ok, status = fut.result()
-            if not ok:
-                broken.append((url, status))
-                print(f"[BROKEN] {url} -> {status}")
-            else:
-                print(f"[OK]     {url} -> {status}")
-
-    print("\nSummary:")
-    print(f"Total links checked: {len(links)}")
-    print(f"Broken links: {len(broken)}")
-    if broken:
-        print("\nList of broken links:")
-        for url, reason in broken:
-            print(f" - {url} ({reason})")
-        if args.output:
-            output_broken(broken, args.output)
-        sys.exit(2)
-    else:
-        print("All links are healthy.")
-        sys.exit(0)
+    runner = uvloop.run if uvloop else asyncio.run
+    sys.exit(runner(run(args)))
 
 if __name__ == "__main__":
     main()
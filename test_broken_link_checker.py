@@ -1,7 +1,270 @@
-from broken_link_checker import extract_links
+import asyncio
+import json
+import socket
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import broken_link_checker
+from broken_link_checker import (CachingResolver, canonicalize, check_link, crawl,
+                                 create_session, extract_links, fetch_page,
+                                 output_broken, prewarm_dns)
+
+@pytest.fixture(autouse=True)
+def reset_run_state():
+    # Per-host state lives at module level for the length of a run; each test
+    # is its own run (and its own event loop, which the semaphores bind to)
+    yield
+    broken_link_checker.HEAD_BAD.clear()
+    broken_link_checker.DEAD_HOSTS.clear()
+    broken_link_checker.HOST_SLOTS.clear()
+
+def serve(routes, check):
+    # Run check(server, session) against a local aiohttp app serving routes
+    async def main():
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestServer(app) as server, create_session() as session:
+            return await check(server, session)
+    return asyncio.run(main())
 
 def test_extract_links_basic():
     html = '<a href="http://example.com">Link</a>'
     base_url = "http://test.com"
     links = extract_links(base_url, html)
-    assert "http://example.com" in links
+    assert "http://example.com/" in links
+
+def test_extract_links_collapses_equivalent_urls():
+    html = ('<a href="/page#top">A</a>'
+            '<a href="HTTP://TEST.com/page">B</a>'
+            '<a href="http://test.com/page#bottom">C</a>')
+    links = extract_links("http://test.com", html)
+    assert list(links) == ["http://test.com/page"]
+
+def test_canonicalize():
+    assert canonicalize("HTTPS://Example.COM#frag") == "https://example.com/"
+    assert canonicalize("http://example.com/a?b=1#c") == "http://example.com/a?b=1"
+
+def test_extract_links_skips_non_http_hrefs():
+    html = ('<a href="#top">A</a><a href="javascript:void(0)">B</a>'
+            '<a href="MAILTO:a@b.com">C</a><a href="tel:123">D</a>'
+            '<a href="ftp://test.com/f">E</a><a href=" about.html ">F</a>')
+    links = extract_links("http://test.com/", html)
+    assert list(links) == ["http://test.com/about.html"]
+
+def test_output_broken_json_and_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    broken = [("http://test.com/a", 404), ("http://test.com/b,c", "TimeoutError")]
+    output_broken(broken, "json")
+    output_broken(broken, "csv")
+    assert json.loads((tmp_path / "broken_links.json").read_text()) == [
+        ["http://test.com/a", 404], ["http://test.com/b,c", "TimeoutError"]]
+    assert (tmp_path / "broken_links.csv").read_text().splitlines() == [
+        "URL,Error", "http://test.com/a,404", '"http://test.com/b,c",TimeoutError']
+
+def test_extract_links_honors_base_href():
+    html = '<html><head><base href="http://cdn.test.com/docs/"></head><body><a href="page.html">A</a></body></html>'
+    links = extract_links("http://test.com/", html)
+    assert list(links) == ["http://cdn.test.com/docs/page.html"]
+
+def test_extract_links_empty_document():
+    assert list(extract_links("http://test.com/", b"   ")) == []
+
+def test_fetch_page_uses_header_charset():
+    async def page(request):
+        return web.Response(body="<a href='/café'>x</a>".encode("utf-8"),
+                            headers={"Content-Type": "text/html; charset=utf-8"})
+
+    async def check(server, session):
+        url = str(server.make_url("/"))
+        html, charset = await fetch_page(session, url)
+        assert charset == "utf-8"
+        return url, extract_links(url, html, charset)
+
+    url, links = serve([web.get("/", page)], check)
+    assert links == {url + "café"}
+
+def test_check_link_remembers_hosts_that_reject_head():
+    heads = []
+
+    async def reject_head(request):
+        heads.append(request.path)
+        return web.Response(status=405)
+
+    async def page(request):
+        return web.Response(text="ok")
+
+    async def check(server, session):
+        first = await check_link(session, str(server.make_url("/a")))
+        second = await check_link(session, str(server.make_url("/b")))
+        return server.make_url("/").raw_authority, first, second
+
+    routes = [web.head("/{name}", reject_head), web.get("/{name}", page, allow_head=False)]
+    host, first, second = serve(routes, check)
+    assert first[1:] == (True, 200)
+    assert second[1:] == (True, 200)
+    assert heads == ["/a"]  # /b went straight to GET
+    assert broken_link_checker.HEAD_BAD == {host}
+
+def test_check_link_falls_back_to_get_when_head_drops_connection():
+    heads = []
+
+    async def drop_head(request):
+        heads.append(request.path)
+        request.transport.close()
+        return web.Response()
+
+    async def page(request):
+        return web.Response(text="ok")
+
+    async def check(server, session):
+        first = await check_link(session, str(server.make_url("/a")))
+        second = await check_link(session, str(server.make_url("/b")))
+        return server.make_url("/").raw_authority, first, second
+
+    routes = [web.head("/{name}", drop_head), web.get("/{name}", page, allow_head=False)]
+    host, first, second = serve(routes, check)
+    assert first[1:] == (True, 200)
+    assert second[1:] == (True, 200)
+    assert set(heads) == {"/a"}  # aiohttp may retry the dropped HEAD once itself
+    assert broken_link_checker.HEAD_BAD == {host}
+
+def test_crawl_depth_and_same_domain():
+    site = {
+        "/": '<a href="/a">A</a><a href="/b">B</a><a href="http://other.test/x">X</a>',
+        "/a": '<a href="/">Home</a><a href="/c">C</a>',
+        "/b": '<a href="/a">A</a>',
+        "/c": '<a href="/d">D</a>',
+    }
+    fetched = []
+
+    async def page(request):
+        fetched.append(request.path)
+        return web.Response(text=site[request.path], content_type="text/html")
+
+    async def check(server, session):
+        base = str(server.make_url("/"))
+        return base, await crawl(session, base, 1, same_domain_only=True)
+
+    routes = [web.get(path, page) for path in site]
+    base, links = serve(routes, check)
+    # Depth 0 is the base page, depth 1 its same-domain links; /c is found
+    # on /a but never fetched, and no page is fetched twice
+    assert sorted(fetched) == ["/", "/a", "/b"]
+    assert links == {base, base + "a", base + "b", base + "c"}
+
+def test_extract_links_skips_malformed_urls():
+    html = ('<base href="http://[::1/"><a href="http://[::1/x">A</a>'
+            '<a href="/[::1">B</a><a href="/ok">C</a>')
+    links = extract_links("http://test.com/", html)
+    assert links == {"http://test.com/[::1", "http://test.com/ok"}
+
+def test_check_link_rejects_urls_without_a_valid_host():
+    async def check(server, session):
+        return [await check_link(session, url) for url in ("http:///path", "http://h:abc/")]
+
+    assert serve([], check) == [("http:///path", False, "invalid-host"),
+                                ("http://h:abc/", False, "invalid-host")]
+
+def test_check_link_caches_dead_hosts():
+    # Bind and release a port so nothing is listening on it
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # The IDN host fails DNS; the connector reports it by its punycode name
+    fake = FakeResolver({"xn--bcher-kva.invalid": [OSError("Name or service not known")]})
+    urls = [f"http://127.0.0.1:{port}/a", f"http://127.0.0.1:{port}/b",
+            "http://bücher.invalid/a", "http://bücher.invalid/b"]
+
+    async def main():
+        async with CachingResolver(fake) as resolver, create_session(resolver) as session:
+            return [await check_link(session, url) for url in urls]
+
+    refused, refused_again, unresolved, unresolved_again = asyncio.run(main())
+    assert refused[1] is False and "Cannot connect" in refused[2]
+    assert refused_again == (urls[1], False, "cached-dead-host")
+    assert unresolved[1] is False and "Cannot connect" in unresolved[2]
+    assert unresolved_again == (urls[3], False, "cached-dead-host")
+    assert fake.calls == ["xn--bcher-kva.invalid"]
+    assert broken_link_checker.DEAD_HOSTS == {("127.0.0.1", port), ("xn--bcher-kva.invalid", 80)}
+
+class FakeResolver:
+    # Stands in for ThreadedResolver; each call pops the host's next outcome,
+    # either an exception to raise or a delay in seconds before succeeding
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.calls = []
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        self.calls.append(host)
+        outcome = self.outcomes[host].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        await asyncio.sleep(outcome)
+        return [{"hostname": host, "host": "127.0.0.1", "port": port,
+                 "family": socket.AF_INET, "proto": 0, "flags": 0}]
+
+    async def close(self):
+        pass
+
+def test_caching_resolver_keeps_successes_and_retries_failures():
+    fake = FakeResolver({"a.test": [OSError("SERVFAIL"), 0, 0]})
+
+    async def main():
+        resolver = CachingResolver(fake)
+        with pytest.raises(OSError):
+            await resolver.resolve("a.test", 80)
+        first = await resolver.resolve("a.test", 80)
+        second = await resolver.resolve("a.test", 80)
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert fake.calls == ["a.test", "a.test"]  # failure retried, success reused
+
+def test_caching_resolver_survives_cancelled_waiter():
+    fake = FakeResolver({"a.test": [0.05]})
+
+    async def main():
+        resolver = CachingResolver(fake)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(resolver.resolve("a.test", 80), 0.01)
+        return await resolver.resolve("a.test", 80)
+
+    assert asyncio.run(main())[0]["host"] == "127.0.0.1"
+    assert fake.calls == ["a.test"]
+
+def test_prewarm_dns_is_bounded_by_timeout(monkeypatch):
+    monkeypatch.setattr(broken_link_checker, "TIMEOUT", 0.05)
+    fake = FakeResolver({"fast.test": [0], "slow.test": [3600]})
+
+    async def main():
+        resolver = CachingResolver(fake)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await prewarm_dns(resolver, ["http://fast.test/", "https://slow.test/x"])
+        elapsed = loop.time() - start
+        await resolver.resolve("fast.test", 80, socket.AF_UNSPEC)
+        return elapsed
+
+    assert asyncio.run(main()) < 1
+    assert sorted(fake.calls) == ["fast.test", "slow.test"]  # fast.test came from the cache
+
+def test_prewarm_dns_matches_connector_key_for_idn_hosts():
+    fake = FakeResolver({"xn--bcher-kva.test": [0]})
+
+    async def page(request):
+        return web.Response(text="ok")
+
+    async def main():
+        app = web.Application()
+        app.add_routes([web.get("/", page)])
+        async with TestServer(app) as server, CachingResolver(fake) as resolver, \
+                create_session(resolver) as session:
+            url = f"http://bücher.test:{server.port}/"
+            await prewarm_dns(resolver, [url])
+            return await check_link(session, url)
+
+    assert asyncio.run(main())[1:] == (True, 200)
+    assert fake.calls == ["xn--bcher-kva.test"]  # the connect reused the prewarmed lookup